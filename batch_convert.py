@@ -0,0 +1,158 @@
+import argparse
+import glob
+import gzip
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import warhammer_abilities_core
+from warhammer_abilities_core import (categorize_abilities, core_rules_url, extract_abilities_from_file, generate_html_report,
+                                      load_roster_stratagems, page_cache)
+
+
+def find_rosters(inputs):
+    # Directories contribute their *.json files, anything else is taken as a file or glob pattern
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths.extend(sorted(glob.glob(os.path.join(item, "*.json"))))
+        else:
+            paths.extend(sorted(glob.glob(item)) or [item])
+    return list(dict.fromkeys(paths))
+
+
+def warm_page_cache(url, include_core):
+    # Fetch the shared Wahapedia pages once up front so the workers all read them from
+    # the disk cache instead of racing each other to download the same pages
+    status = {}
+    for page_url in [url, core_rules_url(url)] if include_core else [url]:
+        try: status[page_url] = page_cache.fetch(page_url)[1]
+        except Exception as e: status[page_url] = f"failed ({e.__class__.__name__}: {e})"
+    return status
+
+
+def reset_worker_state():
+    # Forked workers inherit the HTTP session warm_page_cache used, pooled keep-alive sockets
+    # included, so each worker drops it and opens connections of its own
+    warhammer_abilities_core._http_session = None
+
+
+def output_path_for(path, output_dir):
+    return os.path.join(output_dir, f"{os.path.splitext(os.path.basename(path))[0]}_reordered.html")
+
+
+def convert_roster(path, output_dir, url, exclude_abilities, include_core, compact, lazy):
+    # Runs in a worker process, never raises: returns a result dict with timings per stage
+    result = {"path": path, "ok": False, "timings": {}, "stratagems": None}
+    timings = result["timings"]
+    started = time.perf_counter()
+    try:
+        original_filename = os.path.splitext(os.path.basename(path))[0]
+
+        with open(path, "rb") as f:
+            abilities, detachment_abilities, detachment_name = extract_abilities_from_file(f)
+        timings["extract"] = time.perf_counter() - started
+
+        stratagems, core_stratagems, url_core = [], [], None
+        if detachment_name and url:
+            stage = time.perf_counter()
+            url_core = core_rules_url(url)
+            stratagems, core_stratagems, origins = load_roster_stratagems(detachment_name[0], url, include_core)
+            result["stratagems"] = {"detachment": detachment_name[0], "found": len(stratagems),
+                                    "core": len(core_stratagems), "origin": origins.get("detachment")}
+            timings["stratagems"] = time.perf_counter() - stage
+
+        stage = time.perf_counter()
+        categorized = categorize_abilities(detachment_abilities, core_stratagems, stratagems, abilities, exclude_abilities)
+        html_report = generate_html_report(categorized, original_filename, url_core, url, compact=compact, lazy=lazy)
+        timings["report"] = time.perf_counter() - stage
+
+        output_path = output_path_for(path, output_dir)
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.write(html_report)
+        if compact or lazy:
+            with open(output_path + ".gz", "wb") as f:
+                f.write(gzip.compress(html_report.encode("utf-8")))
+
+        result.update(ok=True, output=output_path)
+    except Exception as e:
+        result["error"] = f"{e.__class__.__name__}: {' '.join(str(e).split())}"
+        result["traceback"] = traceback.format_exc()
+    result["elapsed"] = time.perf_counter() - started
+    return result
+
+
+def format_result(result):
+    name = os.path.basename(result["path"])
+    stages = " ".join(f"{stage}={seconds:.2f}s" for stage, seconds in result["timings"].items())
+    if not result["ok"]:
+        return " ".join(filter(None, ["FAIL", name, f"{result['elapsed']:.2f}s", stages, result["error"]]))
+
+    line = " ".join(filter(None, ["ok  ", name, f"{result['elapsed']:.2f}s", stages, "->", result["output"]]))
+    stratagems = result["stratagems"]
+    if stratagems:
+        if stratagems["found"]:
+            line += f" [{stratagems['detachment']}: {stratagems['found']} stratagems, {stratagems['core']} core, {stratagems['origin']}]"
+        else:
+            line += f" [{stratagems['detachment']}: no stratagems found]"
+    return line
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert New Recruit JSON rosters to reorderable HTML ability references.")
+    parser.add_argument("inputs", nargs="+", help="roster files, directories of *.json rosters or glob patterns")
+    parser.add_argument("-o", "--output-dir", default=".", help="directory the reports are written to (default: .)")
+    parser.add_argument("-u", "--url", default="", help="Wahapedia main-faction URL for stratagem support")
+    parser.add_argument("--core", action="store_true", help="include core stratagems as well")
+    parser.add_argument("-x", "--exclude", action="append", default=[], help="ability or stratagem to exclude, repeatable")
+    parser.add_argument("--compact", action="store_true", help="write compact reports plus a .html.gz copy")
+    parser.add_argument("--lazy", action="store_true", help="render phases on demand (implies a compact report)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="worker processes (default: CPU count)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="print tracebacks of failed rosters")
+    args = parser.parse_args()
+
+    paths = find_rosters(args.inputs)
+    if not paths:
+        parser.error("no rosters found")
+    os.makedirs(args.output_dir, exist_ok=True)
+    exclude_abilities = [x.strip() for x in args.exclude if x.strip()]
+
+    started = time.perf_counter()
+    if args.url:
+        for page_url, status in warm_page_cache(args.url, args.core).items():
+            print(f"page {page_url}: {status}")
+
+    # Rosters that would write the same report as an earlier one (same file name in two
+    # input directories) fail instead of silently overwriting it
+    failed = 0
+    claimed = {}
+    for path in paths:
+        output_path = output_path_for(path, args.output_dir)
+        key = os.path.normcase(os.path.abspath(output_path))
+        if key in claimed:
+            failed += 1
+            print(format_result({"path": path, "ok": False, "timings": {}, "elapsed": 0.0,
+                                 "error": f"{path} has the same output {output_path} as {claimed[key]}"}))
+        else:
+            claimed[key] = path
+
+    converting = list(claimed.values())
+    with ProcessPoolExecutor(max_workers=max(1, min(args.jobs, len(converting))),
+                             initializer=reset_worker_state) as executor:
+        futures = [executor.submit(convert_roster, path, args.output_dir, args.url, exclude_abilities,
+                                   args.core, args.compact, args.lazy) for path in converting]
+        for future in as_completed(futures):
+            result = future.result()
+            print(format_result(result))
+            if not result["ok"]:
+                failed += 1
+                if args.verbose: print(result["traceback"], file=sys.stderr)
+
+    print(f"{len(paths) - failed}/{len(paths)} rosters converted in {time.perf_counter() - started:.2f}s")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
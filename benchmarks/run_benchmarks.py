@@ -0,0 +1,200 @@
+import argparse
+import functools
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import synthetic
+import warhammer_abilities_core as war
+
+
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "baseline.json")
+
+# forces, units, nesting depth of each unit, distinct datasheets the units are drawn from
+ROSTER_SIZES = {
+    "small": dict(forces=1, units=15, depth=1, datasheets=15),
+    "medium": dict(forces=1, units=60, depth=2, datasheets=30),
+    "large": dict(forces=3, units=300, depth=4, datasheets=60),
+    "huge": dict(forces=8, units=2000, depth=8, datasheets=80),
+}
+
+# Stage regressions smaller than this are noise whatever the ratio
+MIN_SECONDS_DELTA = 0.002
+MIN_KIB_DELTA = 64
+
+
+class PageHandler(SimpleHTTPRequestHandler):
+    # Serves <slug>.html for any URL ending in /<slug>/, the naming build_rules_snapshot.py uses
+    def translate_path(self, path):
+        slug = path.split("?")[0].rstrip("/").rsplit("/", 1)[-1]
+        return os.path.join(self.directory, slug + ".html")
+
+    def log_message(self, *args):
+        pass
+
+
+def serve_pages(directory):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(PageHandler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/wh40k10ed/factions/"
+
+
+def write_synthetic_pages(directory):
+    with open(os.path.join(directory, "space-marines.html"), "w", encoding="utf-8") as f:
+        f.write(synthetic.faction_page())
+    with open(os.path.join(directory, "core-rules.html"), "w", encoding="utf-8") as f:
+        f.write(synthetic.core_rules_page())
+
+
+def measure(fn, repeat, setup=None):
+    # Best and median wall time over `repeat` runs, then one extra run under tracemalloc
+    # for the peak allocation (kept apart so tracing overhead does not skew the timings)
+    times = []
+    for _ in range(repeat):
+        if setup: setup()
+        started = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - started)
+
+    if setup: setup()
+    tracemalloc.start()
+    fn()
+    peak_kib = tracemalloc.get_traced_memory()[1] / 1024
+    tracemalloc.stop()
+    return result, {"best": min(times), "median": statistics.median(times), "peak_kib": round(peak_kib, 1)}
+
+
+def measure_import(statement, repeat):
+    # Import time in a fresh interpreter each run, the cold start a worker or the app pays
+    code = f"import time; started = time.perf_counter(); {statement}; print(time.perf_counter() - started)"
+    times = [float(subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True).stdout)
+             for _ in range(repeat)]
+    return {"best": min(times), "median": statistics.median(times), "peak_kib": 0}
+
+
+def run(sizes, repeat, faction_url, detachment_name, cache_root):
+    results = {
+        "import/core": measure_import("import warhammer_abilities_core", repeat),
+        "import/core_fetch_stack": measure_import("import warhammer_abilities_core, requests, bs4, lxml.html", repeat),
+        "import/app": measure_import("import warhammer_abilities_reference", repeat),
+    }
+    core_url = war.core_rules_url(faction_url)
+
+    def cold_page_cache():
+        # Fresh disk cache and heading index, so every run fetches and parses the pages
+        war.page_cache = war.PageCache(tempfile.mkdtemp(dir=cache_root), war.PAGE_CACHE_TTL, war.PAGE_CACHE_MAX_BYTES)
+        war._heading_index_cache.clear()
+
+    def extract_stratagems(name, url):
+        found = []
+        war.extract_stratagems_from_waha(found, name, url)
+        return war.stratagem_records(found)
+
+    load = lambda: (extract_stratagems(detachment_name, faction_url), extract_stratagems("Stratagem", core_url))
+    (stratagems, core_stratagems), results["pages/stratagems"] = measure(load, repeat, cold_page_cache)
+    _, results["pages/stratagems_cached"] = measure(load, repeat)
+    if not stratagems:
+        raise SystemExit(f"No stratagems found for {detachment_name!r} on {faction_url}")
+
+    for size in sizes:
+        roster = synthetic.roster(**ROSTER_SIZES[size])
+        extract = lambda: war.extract_abilities_from_json(roster)
+        (abilities, detachment_abilities, _), results[f"{size}/extract"] = measure(extract, repeat)
+        roster_bytes = json.dumps(roster).encode("utf-8")
+        war.extract_abilities_from_bytes(roster_bytes)
+        _, results[f"{size}/extract_cached"] = measure(lambda: war.extract_abilities_from_bytes(roster_bytes), repeat)
+        categorize = lambda: war.categorize_abilities(detachment_abilities, core_stratagems, stratagems, abilities, ["Doctrine"])
+        categorized, results[f"{size}/categorize"] = measure(categorize, repeat, war.classify_ability_text.cache_clear)
+        for mode, options in (("report", {}), ("report_compact", {"compact": True}), ("report_lazy", {"lazy": True})):
+            render = lambda: war.generate_html_report(categorized, "benchmark", core_url, faction_url, **options)
+            _, results[f"{size}/{mode}"] = measure(render, repeat)
+    return results
+
+
+def compare(results, baseline, threshold):
+    # Returns the stage lines that got slower or hungrier than the baseline allows
+    regressions = []
+    for stage, current in results.items():
+        previous = baseline.get(stage)
+        if not previous: continue
+        if (current["best"] > previous["best"] * (1 + threshold) and
+                current["best"] - previous["best"] > MIN_SECONDS_DELTA):
+            regressions.append(f"{stage}: {previous['best'] * 1000:.1f} ms -> {current['best'] * 1000:.1f} ms")
+        if (current["peak_kib"] > previous["peak_kib"] * (1 + threshold) and
+                current["peak_kib"] - previous["peak_kib"] > MIN_KIB_DELTA):
+            regressions.append(f"{stage}: {previous['peak_kib']:.0f} KiB -> {current['peak_kib']:.0f} KiB peak")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the roster pipeline stage by stage against synthetic rosters.")
+    parser.add_argument("--sizes", default=",".join(ROSTER_SIZES), help=f"comma separated roster sizes (default: all of {', '.join(ROSTER_SIZES)})")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="timed runs per stage (default: 5)")
+    parser.add_argument("--pages", help="directory of saved Wahapedia pages (<faction-slug>.html and core-rules.html) "
+                                        "instead of the synthetic ones")
+    parser.add_argument("--faction", default="space-marines", help="faction slug of the page to use (default: space-marines)")
+    parser.add_argument("--detachment", default="Gladius Task Force", help="detachment to look up (default: Gladius Task Force)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline file (default: benchmarks/baseline.json)")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown/growth over the baseline (default: 0.25)")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    sizes = [x.strip() for x in args.sizes.split(",") if x.strip()]
+    unknown = [x for x in sizes if x not in ROSTER_SIZES]
+    if unknown:
+        parser.error(f"unknown sizes: {', '.join(unknown)}")
+
+    work_dir = tempfile.mkdtemp(prefix="waha-bench-")
+    try:
+        pages_dir = args.pages
+        if not pages_dir:
+            pages_dir = os.path.join(work_dir, "pages")
+            os.makedirs(pages_dir)
+            write_synthetic_pages(pages_dir)
+        server, factions_url = serve_pages(pages_dir)
+        try:
+            results = run(sizes, args.repeat, factions_url + args.faction, args.detachment, work_dir)
+        finally:
+            server.shutdown()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"{'stage':32} {'best ms':>10} {'median ms':>10} {'peak KiB':>10}")
+    for stage, r in results.items():
+        print(f"{stage:32} {r['best'] * 1000:10.2f} {r['median'] * 1000:10.2f} {r['peak_kib']:10.0f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=1)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=1)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --save-baseline to create one")
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        regressions = compare(results, json.load(f), args.threshold)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    print(f"{len(regressions)} regressions over {args.threshold:.0%} against {args.baseline}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
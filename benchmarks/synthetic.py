@@ -0,0 +1,99 @@
+import random
+
+
+# Ability texts modelled on real datasheets, each one hits one or more phase keywords
+ABILITY_TEXTS = [
+    "Each time a model in this unit makes a melee attack, add 1 to the Hit roll.",
+    "In your Shooting phase, after this unit has shot, select one enemy unit hit by one or more of those attacks. Until the end of the phase, that unit is suppressed.",
+    "At the start of your Command phase, if this unit is on the battlefield, you gain 1CP.",
+    "This unit can make a Normal move of up to 6\" in the Movement phase. Deep Strike.",
+    "During the Declare Battle Formations step, this unit can be set up in Reserves.",
+    "Each time an enemy unit targets this unit, subtract 1 from the Hit roll.",
+    "Once per battle, at the end of your opponent's turn, this unit can fight.",
+    "This model has a 4+ invulnerable save.",
+    "While this model is leading a unit, weapons equipped by models in that unit have the [LETHAL HITS] ability.",
+    "Each time this unit makes a Charge move, until the end of the turn it can fight first.",
+    "Models in this unit have the Stealth ability. Fire Overwatch cannot be used against this unit.",
+    "Scouts 6\". Infiltrators.",
+    "When this unit Falls Back, it can still shoot and declare a charge in the same turn.",
+    "Each time a model in this unit makes an attack in the Fight phase, re-roll a Wound roll of 1.",
+    "Once per battle round, you can target this unit with a Stratagem for 0CP.",
+    "In the Battle-shock step, this unit automatically passes Battle-shock tests.",
+    "In your opponent's Charge phase, after an enemy unit has ended a Charge move, this unit can shoot.",
+    "ADEPTUS ASTARTES models can use the ^^**Oath of Moment**^^ ability. The ORDER is given.",
+    "The bearer's unit can be targeted by the Heroic Intervention Stratagem for 0CP.",
+    "Until the start of your next turn, this unit has the Benefit of Cover.",
+]
+
+
+def roster(forces=1, units=40, depth=2, datasheets=20, seed=1):
+    # Units are picked from a pool of `datasheets` templates so large rosters repeat the
+    # same abilities many times, like real armies with several squads of one datasheet.
+    # Every unit carries a chain of `depth` nested model selections.
+    rnd = random.Random(seed)
+    pool = []
+    for i in range(datasheets):
+        abilities = [(f"Ability {i}-{j}", rnd.choice(ABILITY_TEXTS)) for j in range(rnd.randint(1, 5))]
+        wargear = [(f"Wargear {i}-{d}", rnd.choice(ABILITY_TEXTS)) for d in range(depth)]
+        pool.append((f"Datasheet {i}", abilities, wargear))
+
+    def profile(name, text):
+        return {"typeName": "Abilities", "name": name,
+                "characteristics": [{"name": "Description", "$text": text}]}
+
+    def unit():
+        name, abilities, wargear = rnd.choice(pool)
+        node = {"name": name, "profiles": [profile(*ability) for ability in abilities], "selections": []}
+        current = node
+        for d, ability in enumerate(wargear):
+            model = {"name": f"Model {d}", "profiles": [profile(*ability)],
+                     "selections": [{"name": "Bolt pistol", "selections": []}]}
+            current["selections"].append(model)
+            current = model
+        return node
+
+    all_forces = []
+    for f in range(forces):
+        selections = [{"name": "Detachment", "group": "", "selections": [{
+            "name": "Gladius Task Force",
+            "rules": [{"name": "Combat Doctrines", "description": ABILITY_TEXTS[2]}],
+            "profiles": [profile("Doctrine", ABILITY_TEXTS[4])]}]}]
+        selections += [unit() for _ in range(units // forces)]
+        all_forces.append({"name": f"Force {f}", "selections": selections})
+    return {"roster": {"name": "Benchmark", "forces": all_forces}}
+
+
+def faction_page(detachments=12, stratagems=6, datasheets=400, seed=1):
+    # A Wahapedia-sized faction page: detachment sections with their stratagems followed by
+    # a long run of datasheets, tables and scripts the heading index has to wade through
+    rnd = random.Random(seed)
+    names = ["Gladius Task Force"] + [f"Detachment {i}" for i in range(1, detachments)]
+    out = ["<!DOCTYPE html><html><head><title>Faction</title><style>h2{color:red}</style>",
+           "<script>var config = {tooltips: true};</script></head><body><h1>Faction</h1><p>Intro text.</p>"]
+    for name in names:
+        out.append(f"<h2>{name}</h2><div>Detachment Rule\n{rnd.choice(ABILITY_TEXTS)}</div>")
+        body = ["Stratagems"]
+        for i in range(stratagems):
+            body += [f"{name.upper()} STRATAGEM {i}", f"{i % 3 + 1}CP", f"{name} – Battle Tactic Stratagem", "",
+                     f"WHEN: Your Shooting phase. TARGET: One unit from your army. EFFECT: {rnd.choice(ABILITY_TEXTS)}",
+                     "RESTRICTIONS: Once per phase."]
+        out.append("<div>" + "\n".join(body) + "</div>")
+        out.append("<h3>Enhancements</h3><div><ul><li>Enhancement A</li><li>Enhancement B</li></ul></div>")
+    for i in range(datasheets):
+        rows = "".join(f"<tr><td>Weapon {j}</td><td>24\"</td><td>2</td><td>3+</td><td>4</td><td>-1</td><td>1</td></tr>"
+                       for j in range(8))
+        out.append(f"<h2>Datasheet {i}</h2><div class=\"dsProfile\"><table>{rows}</table></div>"
+                   f"<div class=\"dsAbility\">{' '.join(rnd.choice(ABILITY_TEXTS) for _ in range(4))}</div>"
+                   f"<script>tooltip({i});</script>")
+    out.append("</body></html>")
+    return "\n".join(out)
+
+
+def core_rules_page(stratagems=11):
+    body = []
+    for i in range(stratagems):
+        body += [f"CORE STRATAGEM {i}", f"{i % 2 + 1}CP", "Core – Strategic Ploy Stratagem", "",
+                 f"WHEN: {ABILITY_TEXTS[i % len(ABILITY_TEXTS)]}", "EFFECT: Re-roll one dice."]
+    return ("<!DOCTYPE html><html><body><h1>Core Rules</h1><p>Rules text.</p>"
+            "<h2>Core Stratagems</h2><div>" + "\n".join(body) + "</div>"
+            "<h2>Terrain</h2><div>Ruins, woods and craters.</div></body></html>")
@@ -0,0 +1,78 @@
+import argparse
+import os
+import sqlite3
+import time
+
+from warhammer_abilities_core import HTML_PARSER, SNAPSHOT_PATH, build_heading_index, parse_stratagem_blocks
+
+
+SCHEMA = """
+    CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT) WITHOUT ROWID;
+    CREATE TABLE headings (faction TEXT, rank INTEGER, name TEXT, PRIMARY KEY (faction, rank)) WITHOUT ROWID;
+    CREATE TABLE stratagems (faction TEXT, rank INTEGER, position INTEGER, name TEXT, description TEXT,
+                             PRIMARY KEY (faction, rank, position)) WITHOUT ROWID;
+"""
+
+
+def page_stratagems(html):
+    # Yields (rank, heading, stratagems) for every heading on the page, in lookup order
+    index, fallback = build_heading_index(html), None
+    for rank, (heading, texts) in enumerate(index["headings"].items()):
+        found = []
+        for attempt in range(2):
+            try: found = [[x[0], x[1]] for x in parse_stratagem_blocks(texts) if x]
+            except IndexError: found = []
+            if found or attempt or HTML_PARSER == "html.parser": break
+
+            # Same html.parser retry as extract_stratagems_from_waha
+            fallback = fallback or build_heading_index(html, "html.parser")
+            texts = fallback["headings"].get(heading, [])
+        yield rank, heading, found
+
+
+def build_rules_snapshot(source_dir, path):
+    # Every <faction-slug>.html in source_dir is stored under that slug, which is the last
+    # part of the Wahapedia URL (e.g. space-marines.html, core-rules.html)
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path): os.remove(tmp_path)
+
+    connection = sqlite3.connect(tmp_path)
+    connection.executescript(SCHEMA)
+    factions, stratagem_count = 0, 0
+    for file_name in sorted(os.listdir(source_dir)):
+        faction, ext = os.path.splitext(file_name)
+        if ext.lower() not in (".html", ".htm"): continue
+
+        with open(os.path.join(source_dir, file_name), encoding="utf-8") as f:
+            html = f.read()
+
+        faction = faction.lower()
+        for rank, heading, found in page_stratagems(html):
+            connection.execute("INSERT INTO headings VALUES (?, ?, ?)", (faction, rank, heading))
+            connection.executemany("INSERT INTO stratagems VALUES (?, ?, ?, ?, ?)",
+                                   [(faction, rank, position, name, description)
+                                    for position, (name, description) in enumerate(found)])
+            stratagem_count += len(found)
+        factions += 1
+
+    connection.executemany("INSERT INTO meta VALUES (?, ?)", [("built", str(int(time.time()))),
+                                                              ("factions", str(factions))])
+    connection.commit()
+    connection.execute("VACUUM")
+    connection.close()
+    os.replace(tmp_path, path)
+    return factions, stratagem_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the offline stratagem snapshot from saved Wahapedia pages.")
+    parser.add_argument("source_dir", help="directory of saved faction/core-rules pages named <faction-slug>.html")
+    parser.add_argument("-o", "--output", default=SNAPSHOT_PATH, help=f"snapshot file (default: {SNAPSHOT_PATH})")
+    args = parser.parse_args()
+
+    factions, stratagem_count = build_rules_snapshot(args.source_dir, args.output)
+    print(f"Wrote {stratagem_count} stratagems from {factions} pages to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
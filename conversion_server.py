@@ -0,0 +1,197 @@
+import argparse
+import gzip
+import json
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from warhammer_abilities_core import (categorize_abilities, classify_ability_text, core_rules_url, extract_abilities_from_bytes,
+                                      generate_html_report, load_roster_stratagems, page_cache)
+
+
+MAX_ROSTER_BYTES = 10 * 1024 * 1024
+TRUE_VALUES = ("1", "true", "yes", "on")
+
+
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def gunzip_body(body):
+    # The decompressed roster is held to MAX_ROSTER_BYTES as well, a small gzip body can
+    # otherwise expand to gigabytes. Concatenated gzip members are read one after another.
+    parts, size = [], 0
+    while body:
+        decompressor = zlib.decompressobj(wbits=31)
+        try: part = decompressor.decompress(body, MAX_ROSTER_BYTES + 1 - size)
+        except zlib.error: raise RequestError(400, "Body is not valid gzip.")
+        size += len(part)
+        if size > MAX_ROSTER_BYTES or decompressor.unconsumed_tail:
+            raise RequestError(413, f"Decompressed roster larger than {MAX_ROSTER_BYTES} bytes.")
+        if not decompressor.eof:
+            raise RequestError(400, "Body is not valid gzip.")
+        parts.append(part)
+        body = decompressor.unused_data
+    return b"".join(parts)
+
+
+def convert(roster_bytes, url="", exclude_abilities=(), include_core=False):
+    # Returns (categorized, info), the same steps main() runs for an uploaded file
+    abilities, detachment_abilities, detachment_name = extract_abilities_from_bytes(roster_bytes)
+
+    info = {"detachment": detachment_name[0] if detachment_name else None, "url": url or None, "url_core": None,
+            "stratagems": 0, "core_stratagems": 0, "origin": None}
+    stratagems, core_stratagems = [], []
+    if detachment_name and url:
+        info["url_core"] = core_rules_url(url)
+        stratagems, core_stratagems, origins = load_roster_stratagems(detachment_name[0], url, include_core)
+        info.update(stratagems=len(stratagems), core_stratagems=len(core_stratagems), origin=origins.get("detachment"))
+
+    categorized = categorize_abilities(detachment_abilities, core_stratagems, stratagems, abilities, list(exclude_abilities))
+    return categorized, info
+
+
+class ConversionService:
+    # Conversions run on a fixed pool of worker threads, so the page cache, heading index and
+    # classification caches of this process are shared by all requests. At most queue_size
+    # requests wait for a worker, anything beyond that is turned away with a 503.
+    def __init__(self, workers, queue_size):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="convert")
+        self.slots = threading.BoundedSemaphore(workers + queue_size)
+        self.workers = workers
+        self.queue_size = queue_size
+        self.stats = {"served": 0, "failed": 0, "rejected": 0, "in_flight": 0}
+        self._lock = threading.Lock()
+
+    def count(self, key, n=1):
+        with self._lock:
+            self.stats[key] += n
+
+    def submit(self, fn, *args):
+        # Blocks the calling connection thread until the conversion is done
+        if not self.slots.acquire(blocking=False):
+            self.count("rejected")
+            raise RequestError(503, "Conversion queue is full, try again shortly.")
+        self.count("in_flight")
+        try:
+            return self.executor.submit(fn, *args).result()
+        except Exception as e:
+            self.count("failed")
+            raise RequestError(422, f"Extraction unsuccessful or data format incompatible ({e.__class__.__name__}: {e}).")
+        finally:
+            self.count("in_flight", -1)
+            self.slots.release()
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats.update(workers=self.workers, queue_size=self.queue_size, page_cache=dict(page_cache.stats),
+                     classification_cache=classify_ability_text.cache_info()._asdict())
+        return stats
+
+
+class ConversionHandler(BaseHTTPRequestHandler):
+    # POST /report returns the HTML report, POST /categorized the phases as JSON. The body is the
+    # New Recruit JSON export, options go in the query string:
+    #   url=<faction url>  exclude=<ability> (repeatable)  core=1  compact=1  lazy=1  name=<report name>
+    service = None
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if urlsplit(self.path).path.rstrip("/") == "/health":
+            return self._send_json(200, self.service.snapshot())
+        self._send_json(404, {"error": "Not found."})
+
+    def do_POST(self):
+        started = time.perf_counter()
+        try:
+            parts = urlsplit(self.path)
+            route = parts.path.rstrip("/")
+            if route not in ("/report", "/categorized"):
+                raise RequestError(404, "Not found.")
+            query = parse_qs(parts.query)
+            option = lambda key: query.get(key, [""])[-1].strip()
+            flag = lambda key: option(key).lower() in TRUE_VALUES
+
+            roster_bytes = self._read_body()
+            exclude_abilities = [x.strip() for x in query.get("exclude", []) if x.strip()]
+
+            # Rendering runs on the worker too, the connection thread only does the I/O
+            def work():
+                categorized, info = convert(roster_bytes, option("url"), exclude_abilities, flag("core"))
+                if route == "/categorized":
+                    phases = {phase: [record._asdict() for record in records] for phase, records in categorized.items()}
+                    return json.dumps({**info, "phases": phases}).encode("utf-8"), "application/json"
+                html_report = generate_html_report(categorized, option("name") or "roster", info["url_core"], info["url"],
+                                                   compact=flag("compact"), lazy=flag("lazy"))
+                return html_report.encode("utf-8"), "text/html; charset=utf-8"
+
+            self._send(200, *self.service.submit(work))
+            self.service.count("served")
+        except RequestError as e:
+            # The body may not have been read, so the connection can't be reused
+            self.close_connection = True
+            self._send_json(e.status, {"error": str(e)}, {"Retry-After": "1"} if e.status == 503 else None)
+        finally:
+            self.log_message('"%s" %.3fs', self.requestline, time.perf_counter() - started)
+
+    def _read_body(self):
+        try: length = int(self.headers.get("Content-Length", ""))
+        except ValueError: raise RequestError(411, "Content-Length required.")
+        if length < 0:
+            raise RequestError(400, "Content-Length must not be negative.")
+        if length > MAX_ROSTER_BYTES:
+            raise RequestError(413, f"Roster larger than {MAX_ROSTER_BYTES} bytes.")
+        body = self.rfile.read(length)
+        if self.headers.get("Content-Encoding", "").lower() == "gzip":
+            body = gunzip_body(body)
+        return body
+
+    def _send_json(self, status, data, headers=None):
+        self._send(status, json.dumps(data).encode("utf-8"), "application/json", headers)
+
+    def _send(self, status, body, content_type, headers=None):
+        if len(body) > 1024 and "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body, compresslevel=6)
+            headers = {**(headers or {}), "Content-Encoding": "gzip"}
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def make_server(host, port, workers, queue_size, quiet=False):
+    handler = type("Handler", (ConversionHandler,), {"service": ConversionService(workers, queue_size)})
+    if quiet: handler.log_message = lambda *args: None
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve roster conversions over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1", help="interface to bind (default: 127.0.0.1)")
+    parser.add_argument("-p", "--port", type=int, default=8765, help="port to listen on (default: 8765)")
+    parser.add_argument("-w", "--workers", type=int, default=4, help="conversion worker threads (default: 4)")
+    parser.add_argument("-q", "--queue", type=int, default=32, help="requests allowed to wait for a worker (default: 32)")
+    parser.add_argument("--quiet", action="store_true", help="do not log requests")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.workers, args.queue, args.quiet)
+    print(f"Serving on http://{args.host}:{server.server_port} with {args.workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1924 @@
+# Streamlit-free core of the ability reference: roster extraction, stratagem lookup,
+# classification and report rendering. bs4, requests, lxml and ijson are only imported
+# once they are actually needed, so scripts and workers start quickly.
+import contextvars
+import functools
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+
+# Wahapedia page cache
+PAGE_CACHE_DIR = os.environ.get("WAHA_CACHE_DIR", os.path.join(tempfile.gettempdir(), "warhammer-ability-reference"))
+PAGE_CACHE_TTL = int(os.environ.get("WAHA_CACHE_TTL", 6 * 60 * 60))
+PAGE_CACHE_MAX_BYTES = int(os.environ.get("WAHA_CACHE_MAX_BYTES", 50 * 1024 * 1024))
+
+# Shared HTTP session for rule fetches
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("WAHA_CONNECT_TIMEOUT", 5))
+HTTP_READ_TIMEOUT = float(os.environ.get("WAHA_READ_TIMEOUT", 20))
+HTTP_RETRIES = int(os.environ.get("WAHA_HTTP_RETRIES", 2))
+HTTP_BACKOFF = float(os.environ.get("WAHA_HTTP_BACKOFF", 0.5))
+HTTP_MAX_CONNECTIONS_PER_HOST = int(os.environ.get("WAHA_HTTP_MAX_CONNECTIONS", 4))
+
+# Offline rules snapshot, see build_rules_snapshot.py
+SNAPSHOT_PATH = os.environ.get("WAHA_SNAPSHOT_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "rules_snapshot.sqlite"))
+
+CLASSIFICATION_CACHE_SIZE = 4096
+ROSTER_CACHE_SIZE = 32
+
+HEADING_TAGS = ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']
+# html.parser reproduces the original extraction. lxml is much faster but rebuilds misnested
+# markup, so on such pages its sibling runs (and the stratagems found) can differ.
+HTML_PARSERS = ("html.parser", "lxml", "html5lib")
+HTML_PARSER = os.environ.get("WAHA_HTML_PARSER", "html.parser")
+if HTML_PARSER not in HTML_PARSERS:
+    raise ValueError(f"WAHA_HTML_PARSER must be one of {', '.join(HTML_PARSERS)}, not {HTML_PARSER!r}")
+HEADING_INDEX_CACHE_SIZE = 16
+
+# Stage timings, also written as JSON lines when set
+PERF_LOG_PATH = os.environ.get("WAHA_PERF_LOG")
+
+
+class PerfTrace:
+    # Spans of one submit as {"name", "start_ms", "ms", ...fields}, start relative to the trace
+    def __init__(self):
+        self.id = os.urandom(6).hex()
+        self.started = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, name, started, fields):
+        ended = time.perf_counter()
+        span = {"name": name, "start_ms": round((started - self.started) * 1000, 2), "ms": round((ended - started) * 1000, 2), **fields}
+        with self._lock:
+            self.spans.append(span)
+
+    def ran(self, name):
+        return any(span["name"] == name for span in self.spans)
+
+    def write(self, path):
+        with self._lock:
+            lines = "".join(json.dumps({"trace": self.id, "time": time.time(), **span}) + "\n" for span in self.spans)
+        with _perf_log_lock, open(path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+
+class _Span:
+    __slots__ = ("trace", "name", "fields", "started")
+    enabled = True
+
+    def __init__(self, trace, name, fields):
+        self.trace, self.name, self.fields = trace, name, fields
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.trace.add(self.name, self.started, self.fields)
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+
+class _NullSpan:
+    enabled = False
+
+    def __enter__(self): return self
+    def __exit__(self, *exc): pass
+    def set(self, **fields): pass
+
+
+_NULL_SPAN = _NullSpan()
+current_perf_trace = contextvars.ContextVar("perf_trace", default=None)
+_perf_log_lock = threading.Lock()
+
+
+def perf_span(name, **fields):
+    # Times a block into the active trace; without one it returns a shared no-op span,
+    # callers check span.enabled before computing anything expensive for set()
+    trace = current_perf_trace.get()
+    return _NULL_SPAN if trace is None else _Span(trace, name, fields)
+
+
+def perf_iter(iterable, span, field):
+    # Adds the time spent producing items to span[field] (ms), e.g. parsing behind a generator
+    if not span.enabled:
+        yield from iterable
+        return
+    iterator, spent, end = iter(iterable), 0.0, object()
+    while True:
+        started = time.perf_counter()
+        item = next(iterator, end)
+        spent += time.perf_counter() - started
+        if item is end: break
+        yield item
+    span.set(**{field: round(spent * 1000, 2)})
+
+
+# Report template, @@name@@ marks a slot that is filled in per report
+REPORT_CSS = """
+        /* Base Styles */
+        body {
+            font-family: Arial, sans-serif; 
+            margin: 10px; 
+            background-color: rgb(250, 250, 255);
+            font-size: 16px;
+            line-height: 1.4;
+            word-wrap: break-word;
+            transition: background-color 0.3s, color 0.3s;
+        }
+        
+        /* Dark Mode Styles */
+        body.dark-mode {
+            background-color: rgb(30, 30, 40);
+            color: rgb(220, 220, 230);
+        }
+        
+        body.dark-mode .phase-section {
+            background-color: rgb(40, 40, 50);
+            border-left: 4px solid rgb(70, 130, 180);
+        }
+        
+        body.dark-mode .ability {
+            background-color: rgb(50, 50, 60);
+            border-left: 4px solid rgb(70, 130, 180);
+        }
+        
+        body.dark-mode .ability.enemy {
+            background-color: rgb(60, 40, 40);
+            border-left: 4px solid rgb(180, 70, 70);
+        }
+        
+        body.dark-mode .unit-name {
+            color: rgb(180, 180, 255);
+        }
+        
+        body.dark-mode .ability-name {
+            color: rgb(150, 200, 255);
+        }
+        
+        body.dark-mode .ability-desc {
+            color: rgb(200, 200, 230);
+        }
+        
+        body.dark-mode h1 {
+            color: rgb(180, 180, 255);
+            border-bottom: 2px solid rgb(70, 130, 180);
+        }
+        
+        body.dark-mode h2 {
+            color: rgb(255, 100, 150);
+            border-bottom: 2px solid rgb(70, 130, 180);
+        }
+        
+        /* Custom Entry Form Styles - Light Mode */
+        #custom-entry-container {
+            display: none;
+            margin-bottom: 20px;
+            display: flex; /* Side-by-side layout */
+            gap: 20px; /* Space between form and notes */
+        }
+        
+        #custom-entry {
+            margin-bottom: 20px; 
+            padding: 15px; 
+            background: rgb(245, 245, 255); 
+            border: 1px solid rgb(180, 180, 255); 
+            border-radius: 8px;
+            box-shadow: 0 2px 6px rgba(41, 128, 185, 0.15);
+            flex: 1; /* Take available space */
+            max-width: 35%; /* Limit form width */
+        }
+        
+        #custom-entry h2 {
+            margin-top: 0; 
+            color: rgb(204, 0, 100);
+            font-size: clamp(1.2rem, 4vw, 1.5rem);
+            user-select: none;
+            pointer-events: none;
+            border-bottom: 2px solid rgb(41, 128, 185);
+            padding-bottom: 5px;
+        }
+        
+        #custom-entry label {
+            display: block; 
+            margin-bottom: 12px; 
+            font-weight: bold; 
+            color: rgb(30,30,205);
+        }
+        
+        #custom-entry select,
+        #custom-entry input,
+        #custom-entry textarea {
+            margin-top: 4px;
+            padding: 6px 8px;
+            font-size: 1rem;
+            border: 1px solid rgb(150, 150, 255);
+            border-radius: 4px;
+            color: rgb(25, 25, 103);
+            background-color: white;
+            width: 100%;
+            box-sizing: border-box;
+        }
+        
+        #custom-entry textarea {
+            resize: vertical;
+            font-family: Arial, sans-serif;
+            min-height: 100px;
+        }
+        
+        #custom-entry button {
+            padding: 10px 20px;
+            background-color: rgb(240, 240, 255);
+            color: rgb(50, 50, 25);
+            border: 1px solid rgb(100, 100, 255);
+            border-radius: 3px;
+            font-size: 16px;
+            cursor: pointer;
+            transition: background-color 0.2s;
+            display: block;
+            margin-top: 5px;
+        }
+        
+        #custom-entry button:hover {
+            background-color: rgb(150, 200, 255);
+        }
+        
+        /* Custom Entry Form Styles - Dark Mode */
+        body.dark-mode #custom-entry {
+            background: rgb(40, 40, 50);
+            border: 1px solid rgb(70, 70, 100);
+        }
+        
+        body.dark-mode #custom-entry h2 {
+            color: rgb(255, 100, 150);
+            border-bottom: 2px solid rgb(70, 130, 180);
+        }
+        
+        body.dark-mode #custom-entry label {
+            color: rgb(150, 200, 255);
+        }
+        
+        body.dark-mode #custom-entry select,
+        body.dark-mode #custom-entry input,
+        body.dark-mode #custom-entry textarea {
+            background-color: rgb(60, 60, 70);
+            color: rgb(220, 220, 230);
+            border: 1px solid rgb(80, 80, 120);
+        }
+        
+        body.dark-mode #custom-entry button {
+            background-color: rgb(60, 60, 80);
+            color: rgb(220, 220, 230);
+            border: 1px solid rgb(100, 100, 150);
+        }
+        
+        body.dark-mode #custom-entry button:hover {
+            background-color: rgb(80, 110, 150);
+        }
+        
+        /* Notes Container Styles */
+        #custom-notes-container {
+            flex: 1; /* Take available space */
+            max-width: 65%; /* Limit notes width */
+            margin-bottom: 20px;
+            padding: 15px;
+            background: rgb(245, 245, 255);
+            border: 1px solid rgb(180, 180, 255);
+            border-radius: 8px;
+            box-shadow: 0 2px 6px rgba(41, 128, 185, 0.15);
+        }
+        
+        #custom-notes-container h2 {
+            margin-top: 0;
+            color: rgb(204, 0, 100);
+            font-size: clamp(1.2rem, 4vw, 1.5rem);
+            user-select: none;
+            pointer-events: none;
+            border-bottom: 2px solid rgb(41, 128, 185);
+            padding-bottom: 5px;
+        }
+        
+        #custom-notes {
+            width: 100%;
+            margin-top: 4px;
+            padding: 6px 8px;
+            font-size: 1rem;
+            border: 1px solid rgb(150, 150, 255);
+            border-radius: 4px;
+            color: rgb(25, 25, 103);
+            background-color: white;
+            box-sizing: border-box;
+            resize: vertical;
+            font-family: Arial, sans-serif;
+            min-height: 100px;
+            height: 150px;
+        }
+        
+        /* Notes Container Styles - Dark Mode */
+        body.dark-mode #custom-notes-container {
+            background: rgb(40, 40, 50);
+            border: 1px solid rgb(70, 70, 100);
+        }
+        
+        body.dark-mode #custom-notes-container h2 {
+            color: rgb(255, 100, 150);
+            border-bottom: 2px solid rgb(70, 130, 180);
+        }
+        
+        body.dark-mode #custom-notes {
+            background-color: rgb(60, 60, 70);
+            color: rgb(220, 220, 230);
+            border: 1px solid rgb(80, 80, 120);
+        }
+        
+        /* Responsive Typography */
+        h1 {
+            color: rgb(25, 25, 103);
+            text-align: center;
+            border-bottom: 2px solid rgb(41, 128, 185);
+            padding-bottom: 8px;
+            font-size: clamp(1.5rem, 5vw, 2rem);
+            margin: 15px 0;
+        }
+        
+        h2 {
+            color: rgb(204, 0, 100);
+            border-bottom: 2px solid rgb(41, 128, 185);
+            padding-bottom: 5px; 
+            font-size: clamp(1.2rem, 4vw, 1.5rem);
+            user-select: none;
+            pointer-events: none;
+        }
+        
+        /* Mobile-First Layout */
+        .phase-section {
+            background-color: rgb(245, 245, 255);
+            border-radius: 8px;
+            padding: 12px;
+            margin-bottom: 15px;
+            box-shadow: 0 2px 4px rgba(0,0,0,0.2);
+            border-left: 4px solid rgb(52, 152, 219);
+        }
+        
+        .ability {
+            position: relative;
+            margin-bottom: 12px;
+            padding: 10px;
+            border-left: 4px solid rgb(41, 128, 185);
+            background-color: rgb(240, 240, 250);
+            transition: all 0.2s ease;
+            overflow-wrap: break-word;
+        }
+        
+        .ability.enemy {
+            background-color: rgb(250, 230, 230);
+            border-left: 4px solid rgb(200, 80, 80);
+        }
+        
+        .unit-name {
+            font-weight: bold;
+            color: rgb(25, 25, 103);
+            font-size: clamp(1rem, 3.5vw, 1.1rem);
+        }
+        
+        .ability-name {
+            font-weight: normal;
+            font-style: italic;
+            color: rgb(30, 30, 205);
+            margin: 5px 0;
+            font-size: clamp(0.95rem, 3.5vw, 1.05rem);
+        }
+        
+        .ability-desc {
+            white-space: pre-line;
+            color: rgb(25, 25, 125);
+            font-size: clamp(0.9rem, 3.2vw, 1rem);
+            line-height: 1.5;
+        }
+        
+        /* Mobile-Specific Adjustments */
+        @media (max-width: 600px) {
+            body {
+                margin: 8px;
+                font-size: 14px;
+            }
+            
+            .phase-section {
+                padding: 10px;
+            }
+            
+            .ability {
+                padding: 8px;
+                margin-bottom: 10px;
+            }
+            
+            #save-button,
+            #toggle-entry-btn,
+            #dark-mode-toggle {
+                padding: 8px 16px;
+                font-size: 14px;
+            }
+            
+            #custom-entry-container {
+                flex-direction: column;
+            }
+            
+            #custom-entry, #custom-notes-container {
+                max-width: 100%;
+            }
+        }
+        
+        /* Interactive styles */
+        .ability:hover {
+            background-color: rgb(250, 250, 255);
+        }
+        
+        body.dark-mode .ability:hover {
+            background-color: rgb(60, 60, 70);
+        }
+        
+        body.dark-mode .ability.enemy:hover {
+            background-color: rgb(70, 50, 50);
+        }
+        
+        .ability.dragging {
+            opacity: 0.5;
+            background-color: rgb(250, 250, 255);
+        }
+
+        .ability {
+            -webkit-touch-callout: none;
+        }
+        
+        #save-button,
+        #toggle-entry-btn,
+        #dark-mode-toggle {
+            display: block;
+            padding: 5px 10px;
+            background-color: rgb(240, 240, 255);
+            color: rgb(50, 50, 25);
+            border: 1px solid rgb(100, 100, 255);
+            border-radius: 3px;
+            font-size: 16px;
+            cursor: pointer;
+            transition: background-color 0.2s;
+        }
+        
+        #save-button:hover,
+        #toggle-entry-btn:hover,
+        #dark-mode-toggle:hover {
+            background-color: rgb(150, 200, 255);
+        }
+
+        .delete-btn {
+            position: absolute;
+            top: 5px;
+            right: 5px;
+            background: none;
+            border: none;
+            color: rgb(180, 180, 180);
+            cursor: pointer;
+            font-size: 18px;
+            width: 24px;
+            height: 24px;
+            border-radius: 50%;
+            opacity: 0;
+            transition: all 0.2s;
+            display: flex;
+            align-items: center;
+            justify-content: center;
+            font-family: Arial, sans-serif;
+        }
+        
+        .delete-btn:hover {
+            color: rgb(255, 255, 255);
+            background-color: rgb(200, 0, 0);
+        }
+        
+        .ability:hover .delete-btn {
+            opacity: 1;
+        }
+
+        .duplicate-btn {
+            position: absolute;
+            top: 5px;
+            right: 35px;
+            background: none;
+            border: none;
+            color: rgb(150, 150, 200);
+            cursor: pointer;
+            font-size: 18px;
+            width: 24px;
+            height: 24px;
+            border-radius: 50%;
+            opacity: 0;
+            transition: all 0.2s;
+            display: flex;
+            align-items: center;
+            justify-content: center;
+            font-family: Arial, sans-serif;
+        }
+
+        .duplicate-btn:hover {
+            color: white;
+            background-color: rgb(0, 123, 255);
+        }
+
+        .ability:hover .duplicate-btn {
+            opacity: 1;
+        }
+
+        .color-btn {
+            position: absolute;
+            top: 5px;
+            right: 65px;
+            background: none;
+            border: none;
+            color: rgb(150, 150, 200);
+            cursor: pointer;
+            font-size: 18px;
+            width: 24px;
+            height: 24px;
+            border-radius: 50%;
+            opacity: 0;
+            transition: all 0.2s;
+            display: flex;
+            align-items: center;
+            justify-content: center;
+            font-family: Arial, sans-serif;
+        }
+
+        .color-btn:hover {
+            color: white;
+            background-color: rgb(0, 150, 0);
+        }
+
+        .ability:hover .color-btn {
+            opacity: 1;
+        }
+
+        .button-container {
+            display: flex;
+            gap: 10px;
+            margin-bottom: 20px;
+            justify-content: center;
+        }
+        
+        .button-container button {
+            padding: 8px 5px;
+            cursor: pointer;
+        }
+
+        
+        #aux-buttons {
+            display: inline-flex;
+            gap: 20px;
+            margin-left: 10px;
+            vertical-align: middle;
+        }
+
+        
+        @media (max-width: 600px) {
+            #custom-entry-container {
+                flex-direction: column;
+            }
+            #custom-entry, #custom-notes-container {
+                max-width: 100%;
+            }
+        }
+
+        
+        /* Common button styles */
+        .button-global {
+            padding: 10px 20px;
+            background-color: rgb(240, 240, 255);
+            color: rgb(50, 50, 25);
+            border: 1px solid rgb(100, 100, 255);
+            border-radius: 3px;
+            font-size: 16px;
+            cursor: pointer;
+            transition: background-color 0.2s;
+            display: block;
+            margin-top: 5px;
+        }
+
+        .button-global:hover {
+            background-color: rgb(150, 200, 255);
+        }
+
+        
+        .button-global.link-button {
+            background-color: rgb(197, 213, 240);
+            color: rgb(30, 30, 50);
+            border: 1px solid rgb(29, 54, 94);
+        }
+
+        .button-global.link-button:hover {
+            background-color: rgb(216, 224, 237);
+        }
+
+
+        /* Dark mode button styles */
+        body.dark-mode .button-global {
+            background-color: rgb(60, 60, 80);
+            color: rgb(220, 220, 230);
+            border: 1px solid rgb(100, 100, 150);
+        }
+
+        body.dark-mode .button-global:hover {
+            background-color: rgb(80, 110, 150);
+        }
+
+
+        @media print {
+            body { 
+                background-color: rgb(255, 255, 255);
+                color: rgb(0, 0, 0);
+            }
+            .phase-section { 
+                box-shadow: none; 
+                page-break-inside: avoid;
+                background-color: rgb(255, 255, 255);
+                border-left: 2px solid rgb(0, 0, 0);
+            }
+            .ability {
+                background-color: rgb(255, 255, 255);
+                border-left: 2px solid rgb(0, 0, 0);
+            }
+            .ability-name, .unit-name {
+                color: rgb(0, 0, 0);
+            }
+            .ability-desc {
+                color: rgb(0, 0, 0);
+            }
+            #save-button, #toggle-entry-btn, #dark-mode-toggle, .delete-btn, .duplicate-btn, .color-btn { 
+                display: none; 
+            }
+        }
+    """
+
+REPORT_JS = """
+            let dragged;
+
+            // Compact reports store each description once in the ability-texts table
+            const abilityTexts = document.getElementById("ability-texts");
+            if (abilityTexts) {
+                const texts = JSON.parse(abilityTexts.textContent);
+                document.querySelectorAll(".ability-desc[data-text]").forEach(el => {
+                    el.innerHTML = texts[el.dataset.text];
+                });
+            }
+
+            // Lazy reports embed the abilities as data, each phase is rendered in windows of
+            // RENDER_WINDOW abilities once its end scrolls close to the viewport
+            const RENDER_WINDOW = 40;
+            const pendingAbilities = new Map();
+            const abilityData = document.getElementById("ability-data");
+            let renderObserver = null;
+
+            function createAbility(cls, id, unit, name, desc) {
+                const el = document.createElement("div");
+                el.className = cls;
+                el.id = id;
+                el.setAttribute("draggable", "true");
+                el.innerHTML = '<button class="color-btn" title="Toggle color">🎨</button>' +
+                               '<button class="duplicate-btn" title="Duplicate ability">📑</button>' +
+                               '<button class="delete-btn" title="Remove ability">✕</button>' +
+                               '<div class="unit-name"></div><div class="ability-name"></div><div class="ability-desc"></div>';
+                el.querySelector(".unit-name").textContent = unit;
+                el.querySelector(".ability-name").textContent = name;
+                el.querySelector(".ability-desc").innerHTML = desc;
+                return el;
+            }
+
+            function renderPending(section, limit) {
+                const pending = pendingAbilities.get(section);
+                if (!pending) return;
+                const sentinel = section.querySelector(".render-sentinel");
+                const fragment = document.createDocumentFragment();
+                pending.splice(0, limit || pending.length).forEach(entry => {
+                    fragment.appendChild(createAbility(...entry));
+                });
+                section.insertBefore(fragment, sentinel);
+                if (pending.length) {
+                    // Re-observing reports the current intersection, so a sentinel that is
+                    // still close to the viewport pulls in the next window right away
+                    if (renderObserver) {
+                        renderObserver.unobserve(sentinel);
+                        renderObserver.observe(sentinel);
+                    }
+                } else {
+                    pendingAbilities.delete(section);
+                    if (renderObserver) renderObserver.unobserve(sentinel);
+                    sentinel.remove();
+                }
+            }
+
+            function renderAllPending() {
+                [...pendingAbilities.keys()].forEach(section => renderPending(section));
+            }
+
+            if (abilityData) {
+                const data = JSON.parse(abilityData.textContent);
+                document.querySelectorAll(".phase-section[data-phase-index]").forEach(section => {
+                    const entries = data.phases[section.dataset.phaseIndex];
+                    if (!entries.length) return;
+                    entries.forEach(entry => { entry[4] = data.texts[entry[4]]; });
+                    const sentinel = document.createElement("div");
+                    sentinel.className = "render-sentinel";
+                    section.appendChild(sentinel);
+                    pendingAbilities.set(section, entries);
+                });
+                if ("IntersectionObserver" in window) {
+                    renderObserver = new IntersectionObserver(observed => {
+                        observed.forEach(entry => {
+                            if (entry.isIntersecting) renderPending(entry.target.parentElement, RENDER_WINDOW);
+                        });
+                    }, { rootMargin: "800px 0px" });
+                    pendingAbilities.forEach((_, section) => renderObserver.observe(section.querySelector(".render-sentinel")));
+                } else {
+                    renderAllPending();
+                }
+            }
+
+            // Dark mode toggle functionality
+            document.getElementById("dark-mode-toggle").addEventListener("click", () => {
+                document.body.classList.toggle("dark-mode");
+                const isDarkMode = document.body.classList.contains("dark-mode");
+                localStorage.setItem("darkMode", isDarkMode);
+            });
+
+            // Check for saved dark mode preference
+            if (localStorage.getItem("darkMode") === "true") {
+                document.body.classList.add("dark-mode");
+            }
+
+            // Save and load notes
+            const notesTextarea = document.getElementById("custom-notes");
+            const savedNotesInput = document.getElementById("saved-notes");
+            notesTextarea.addEventListener("input", () => {
+                savedNotesInput.value = notesTextarea.value;
+            });
+            if (savedNotesInput.value) {
+                notesTextarea.value = savedNotesInput.value;
+            }
+
+            // Ability buttons: one delegated listener serves every ability, duplicates and custom entries included
+            function deleteAbility(ability) {
+                ability.remove();
+            }
+
+            function duplicateAbility(ability) {
+                const clone = ability.cloneNode(true);
+                clone.id = 'ability-' + Math.random().toString(36).substr(2, 9);
+                clone.classList.remove("dragging");
+                ability.after(clone);
+            }
+
+            function toggleAbilityColor(ability) {
+                ability.classList.toggle('enemy');
+            }
+
+            document.addEventListener("click", e => {
+                const button = e.target instanceof Element && e.target.closest("button");
+                const ability = button && button.closest(".ability");
+                if (!ability) return;
+                e.stopPropagation();
+                if (button.classList.contains("delete-btn")) deleteAbility(ability);
+                else if (button.classList.contains("duplicate-btn")) duplicateAbility(ability);
+                else if (button.classList.contains("color-btn")) toggleAbilityColor(ability);
+            });
+
+            // Drag-and-drop: ability geometry is measured once per section and only re-measured after
+            // the dragged ability actually moved, pointer positions are applied once per animation frame
+            let dragSection = null;
+            let dragY = 0;
+            let dragFrame = 0;
+            let touchDrag = false;
+            const dragGeometry = new Map();
+
+            function startDrag(el, touch) {
+                dragged = el;
+                touchDrag = touch;
+                dragged.classList.add("dragging");
+                dragGeometry.clear();
+            }
+
+            function endDrag() {
+                if (!dragged) return;
+                cancelAnimationFrame(dragFrame);
+                dragFrame = 0;
+                dragged.classList.remove("dragging");
+                dragged = null;
+                dragSection = null;
+                dragGeometry.clear();
+            }
+
+            function queueDragPosition(section, clientY) {
+                dragSection = section;
+                dragY = clientY;
+                if (!dragFrame) dragFrame = requestAnimationFrame(applyDragPosition);
+            }
+
+            function applyDragPosition() {
+                dragFrame = 0;
+                if (!dragged || !dragSection) return;
+                if (pendingAbilities.has(dragSection)) {
+                    renderPending(dragSection);
+                    dragGeometry.clear();
+                }
+
+                const afterElement = getDragAfterElement(dragSection, dragY) || null;
+                if (dragged.parentElement !== dragSection || dragged.nextElementSibling !== afterElement) {
+                    if (!afterElement) {
+                        dragSection.appendChild(dragged);
+                    } else {
+                        dragSection.insertBefore(dragged, afterElement);
+                    }
+                    dragGeometry.clear();
+                }
+
+                // Touch drags block page scrolling, so scroll while the finger rests near an edge
+                if (touchDrag) {
+                    const step = dragY < 60 ? -12 : dragY > window.innerHeight - 60 ? 12 : 0;
+                    if (step) {
+                        window.scrollBy(0, step);
+                        dragFrame = requestAnimationFrame(applyDragPosition);
+                    }
+                }
+            }
+
+            function getDragAfterElement(container, y) {
+                // First ability whose cached middle lies below y, found by binary search
+                if (!dragGeometry.has(container)) {
+                    const scrollY = window.scrollY;
+                    dragGeometry.set(container, [...container.querySelectorAll(".ability:not(.dragging)")].map(el => {
+                        const box = el.getBoundingClientRect();
+                        return { element: el, middle: box.top + scrollY + box.height / 2 };
+                    }));
+                }
+                const geometry = dragGeometry.get(container);
+                const pageY = y + window.scrollY;
+                let low = 0;
+                let high = geometry.length;
+                while (low < high) {
+                    const middle = (low + high) >> 1;
+                    if (geometry[middle].middle > pageY) high = middle;
+                    else low = middle + 1;
+                }
+                return low < geometry.length ? geometry[low].element : undefined;
+            }
+
+            document.addEventListener("dragstart", e => {
+                const ability = e.target instanceof Element && e.target.closest(".ability");
+                if (!ability) return;
+                cancelPress();
+                startDrag(ability, false);
+            });
+
+            document.addEventListener("dragend", endDrag);
+
+            document.addEventListener("dragover", e => {
+                const section = e.target instanceof Element && e.target.closest(".phase-section");
+                if (!section || !dragged) return;
+                e.preventDefault();
+                queueDragPosition(section, e.clientY);
+            });
+
+            // Touch and pen: hold an ability for LONG_PRESS_MS to pick it up, moving earlier scrolls as usual
+            const LONG_PRESS_MS = 350;
+            let pressTimer = 0;
+            let press = null;
+
+            function cancelPress() {
+                clearTimeout(pressTimer);
+                press = null;
+            }
+
+            // Registered up front and non-passive: whether a touch sequence may block scrolling is
+            // settled at touchstart, so a listener added once the long press fires comes too late
+            document.addEventListener("touchmove", e => {
+                if (dragged && touchDrag) e.preventDefault();
+            }, { passive: false });
+
+            document.addEventListener("pointerdown", e => {
+                if (e.pointerType === "mouse" || !(e.target instanceof Element) || e.target.closest("button")) return;
+                const ability = e.target.closest(".ability");
+                if (!ability) return;
+                cancelPress();
+                press = { id: e.pointerId, x: e.clientX, y: e.clientY };
+                pressTimer = setTimeout(() => startDrag(ability, true), LONG_PRESS_MS);
+            }, { passive: true });
+
+            document.addEventListener("pointermove", e => {
+                if (!press || e.pointerId !== press.id) return;
+                if (!dragged) {
+                    if (Math.abs(e.clientX - press.x) + Math.abs(e.clientY - press.y) > 10) cancelPress();
+                    return;
+                }
+                const target = document.elementFromPoint(e.clientX, e.clientY);
+                const section = target && target.closest(".phase-section");
+                if (section) queueDragPosition(section, e.clientY);
+            }, { passive: true });
+
+            ["pointerup", "pointercancel"].forEach(type => document.addEventListener(type, e => {
+                if (!press || e.pointerId !== press.id) return;
+                cancelPress();
+                endDrag();
+            }, { passive: true }));
+
+            document.addEventListener("contextmenu", e => {
+                if (press) e.preventDefault();
+            });
+
+            document.addEventListener("DOMContentLoaded", () => {
+                document.getElementById("save-button").addEventListener("click", () => {
+                    renderAllPending();
+                    const clonedDoc = document.documentElement.cloneNode(true);
+                    const abilityDataCopy = clonedDoc.querySelector("#ability-data");
+                    if (abilityDataCopy) abilityDataCopy.remove();
+                    const auxButtons = clonedDoc.querySelector("#aux-buttons");
+                    if (auxButtons) {
+                        const links = auxButtons.querySelectorAll("a");
+                        links.forEach(link => link.remove());
+                    }
+                    clonedDoc.querySelectorAll(".ability-desc[data-text]").forEach(el => {
+                        el.innerHTML = "";
+                    });
+                    const htmlContent = clonedDoc.outerHTML;
+                    const blob = new Blob([htmlContent], { type: "text/html" });
+                    const url = URL.createObjectURL(blob);
+                    const a = document.createElement("a");
+                    a.href = url;
+                    a.download = "@@filename@@";
+                    document.body.appendChild(a);
+                    a.click();
+                    setTimeout(() => {
+                        document.body.removeChild(a);
+                        URL.revokeObjectURL(url);
+                    }, 100);
+                });
+            });
+
+            document.getElementById("toggle-entry-btn").addEventListener("click", () => {
+                const container = document.getElementById("custom-entry-container");
+                if (container.style.display === "none" || container.style.display === "") {
+                    container.style.display = "flex";
+                    document.getElementById("toggle-entry-btn").textContent = "Hide Options";
+                } else {
+                    container.style.display = "none";
+                    document.getElementById("toggle-entry-btn").textContent = "Show Options";
+                }
+            });
+
+            function addCustomAbility() {
+                const phase = document.getElementById("custom-phase").value;
+                const unit = document.getElementById("custom-unit").value.trim();
+                const name = document.getElementById("custom-name").value.trim();
+                const desc = document.getElementById("custom-desc").value.trim();
+
+                if (!unit || !name || !desc) {
+                    alert("Please fill in all fields.");
+                    return;
+                }
+
+                const abilityDiv = document.createElement("div");
+                abilityDiv.className = "ability";
+                if (desc.toLowerCase().includes('enemy')) {
+                    abilityDiv.classList.add('enemy');
+                }
+                abilityDiv.id = 'ability-' + Math.random().toString(36).substr(2, 9);
+                abilityDiv.innerHTML = `
+                    <button class="color-btn" title="Toggle color">🎨</button>
+                    <button class="duplicate-btn" title="Duplicate ability">📑</button>
+                    <button class="delete-btn" title="Remove ability">✕</button>
+                    <div class="unit-name">${unit}</div>
+                    <div class="ability-name">${name}</div>
+                    <div class="ability-desc">${desc.replace(/\\n/g, "<br>")}</div>
+                `;
+
+                abilityDiv.setAttribute("draggable", "true");
+
+                const section = [...document.querySelectorAll(".phase-section")].find(s =>
+                    s.querySelector("h2")?.innerText === phase
+                );
+                if (section) {
+                    section.appendChild(abilityDiv);
+                } else {
+                    alert("Phase section not found.");
+                }
+
+                document.getElementById("custom-unit").value = "";
+                document.getElementById("custom-name").value = "";
+                document.getElementById("custom-desc").value = "";
+            }
+        """
+
+REPORT_HTML = """
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <meta charset="UTF-8">
+        <meta name="viewport" content="width=device-width, initial-scale=1.0">
+        <title>Warhammer 40k Ability Reference Extractor</title>
+
+    <style>@@css@@</style>
+
+</head>
+    <body>
+        <h1>Warhammer 40k Ability Reference</h1>
+        <div class="button-container">
+            <button id="save-button" class="button-global">Save Current Order</button>
+            <button id="toggle-entry-btn" class="button-global">Show Options</button>
+            <button id="dark-mode-toggle" class="button-global">Toggle Dark Mode</button>
+        </div>
+        <div id="custom-entry-container" style="display: none;">
+            <div id="custom-entry">
+                <h2>Add Custom Entry</h2>
+                <label>
+                    Phase:
+                    <select id="custom-phase">
+                        <option value="DEPLOYMENT / RESERVES">Deployment / Reserves</option>          
+                        <option value="ANY PHASE">Any Phase</option>
+                        <option value="MOVEMENT PHASE">Movement Phase</option>
+                        <option value="SHOOTING PHASE">Shooting Phase</option>
+                        <option value="CHARGE PHASE">Charge Phase</option>
+                        <option value="FIGHT PHASE">Fight Phase</option>
+                        <option value="OTHER">Other</option>
+                    </select>
+                </label>
+                <label>
+                    Unit Name:
+                    <input type="text" id="custom-unit"/>
+                </label>
+                <label>
+                    Ability Name:
+                    <input type="text" id="custom-name"/>
+                </label>
+                <label>
+                    Ability Description:<br>
+                    <textarea id="custom-desc" rows="4"></textarea>
+                </label>
+                <div id="aux-buttons">
+                    <button onclick="addCustomAbility()" class="button-global">Add Entry</button>
+                    <script>
+                        const urlCore = "@@url_core@@";
+                        if (urlCore && !document.querySelector('#aux-buttons a[href="' + urlCore + '"]')) {
+                            const coreLink = document.createElement('a');
+                            coreLink.href = urlCore;
+                            coreLink.target = '_blank';
+                            coreLink.className = 'button-global link-button';
+                            coreLink.textContent = 'Core Rules';
+                            document.getElementById('aux-buttons').appendChild(coreLink);
+                        }
+                        const urlFaction = "@@url@@";
+                        if (urlFaction && !document.querySelector('#aux-buttons a[href="' + urlFaction + '"]')) {
+                            const factionLink = document.createElement('a');
+                            factionLink.href = urlFaction;
+                            factionLink.target = '_blank';
+                            factionLink.className = 'button-global link-button';
+                            factionLink.textContent = 'Faction Rules';
+                            document.getElementById('aux-buttons').appendChild(factionLink);
+                        }
+                    </script>
+                </div>
+            </div>
+            <div id="custom-notes-container">
+                <h2>Notes</h2>
+                <textarea id="custom-notes" rows="4" placeholder="Enter notes here..."></textarea>
+                <input type="hidden" id="saved-notes" value="">
+            </div>
+        </div>
+        @@content@@
+        @@data@@
+        <script>@@js@@</script>
+    </body>
+    </html>
+    """
+
+
+def compile_report_template(template, **static_fields):
+    # Static slots are filled once, the rest is split into [literal, slot, literal, ...]
+    for name, value in static_fields.items():
+        template = template.replace(f"@@{name}@@", value)
+    return re.split(r"@@(\w+)@@", template)
+
+
+def minify_css(css):
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r" ?([{};:,>]) ?", r"\1", css)
+    return css.replace(";}", "}").strip()
+
+
+def minify_lines(text):
+    # Drops indentation, blank lines and whole-line // comments, line breaks are kept so
+    # inline scripts never depend on semicolon insertion
+    lines = (line.strip() for line in text.splitlines())
+    return "\n".join(line for line in lines if line and not line.startswith("//"))
+
+
+_report_segments = compile_report_template(REPORT_HTML, css=REPORT_CSS, js=REPORT_JS)
+_compact_report_segments = compile_report_template(minify_lines(REPORT_HTML), css=minify_css(REPORT_CSS), js=minify_lines(REPORT_JS))
+
+
+_bold_pattern = re.compile(r"\*\*\^\^(.*?)\^\^\*\*|\*\*(.*?)\*\*")
+
+
+def bold_flagged_text(text):
+    return _bold_pattern.sub(lambda m: f"<strong>{m.group(1) or m.group(2)}</strong>", text)
+
+
+def iter_html_report(categorized_abilities, original_filename, url_core, url, compact=False, lazy=False):
+    # compact: minified assets and every unique description stored once in an embedded table
+    # lazy: like compact, but the abilities themselves are embedded as data and rendered by the page
+    segments = _compact_report_segments if compact or lazy else _report_segments
+    texts = {} if compact or lazy else None
+    phases_data = [] if lazy else None
+    fields = {"filename": f"{original_filename}_reordered.html",
+              "url_core": url_core or "",
+              "url": url or ""}
+
+    yield segments[0]
+    for n in range(1, len(segments), 2):
+        if segments[n] == "content":
+            yield from iter_report_content(categorized_abilities, texts, phases_data)
+        elif segments[n] == "data":
+            if lazy:
+                yield report_data_script("ability-data", {"texts": list(texts), "phases": phases_data})
+            elif compact:
+                yield report_data_script("ability-texts", list(texts))
+        else:
+            yield fields[segments[n]]
+        yield segments[n + 1]
+
+
+def report_data_script(element_id, data):
+    payload = json.dumps(data, ensure_ascii=False, separators=(",", ":")).replace("</", "<\\/")
+    return f'<script id="{element_id}" type="application/json">{payload}</script>'
+
+
+# Descriptions containing any of these are about the opponent's turn and get the "enemy" color
+ENEMY_TURN_MARKERS = ("each time an enemy unit",
+                      "in your opponents",
+                      "end of your opponents",
+                      "start of your opponents",
+                      "model is destroyed,",
+                      "your opponents command",
+                      "your opponents movement",
+                      "your opponents shooting",
+                      "your opponents charge",
+                      "your opponents fight",
+                      "after an enemy unit has",)
+
+
+def report_text(description):
+    # (class_attr, description_bolded) of one description
+    description_lower = description.lower().replace("´","").replace("'","").strip()
+    class_attr = 'ability enemy' if any(x in description_lower for x in ENEMY_TURN_MARKERS) else 'ability'
+    return class_attr, bold_flagged_text(description)
+
+
+def report_entries(abilities, phase_id, shared_texts):
+    # (class_attr, element_id, unit_name, ability_name, description_bolded) per ability of a phase.
+    # shared_texts maps each description to its report_text, so an ability listed in several
+    # phases (or repeated across units) is bolded and checked only once per report
+    for idx, record in enumerate(abilities):
+        text = shared_texts.get(record.description)
+        if text is None:
+            text = shared_texts[record.description] = report_text(record.description)
+        yield text[0], f"ability-{phase_id}-{idx}", record.display_unit, record.name, text[1]
+
+
+def iter_report_content(categorized_abilities, texts=None, phases_data=None):
+    # Descriptions are written inline, referenced in the shared texts table (compact) or,
+    # with phases_data (lazy), only empty sections are written and the abilities collected
+    shared_texts = {}
+    for phase_index, (phase, abilities) in enumerate(categorized_abilities.items()):
+        phase_id = phase.lower().replace(" / ","-").replace(" ","-")
+        entries = report_entries(abilities, phase_id, shared_texts)
+
+        if phases_data is not None:
+            phases_data.append([[class_attr, element_id, unit_name, ability_name, texts.setdefault(description_bolded, len(texts))]
+                                for class_attr, element_id, unit_name, ability_name, description_bolded in entries])
+            yield f'<div class="phase-section" data-phase-index="{phase_index}">\n<h2>{phase}</h2>\n</div>\n'
+            continue
+
+        yield f'<div class="phase-section">\n<h2>{phase}</h2>\n'
+        for class_attr, element_id, unit_name, ability_name, description_bolded in entries:
+            if texts is None:
+                yield (f'<div class="{class_attr}" id="{element_id}" draggable="true">\n'
+                       f'<button class="color-btn" title="Toggle color">🎨</button>\n'
+                       f'<button class="duplicate-btn" title="Duplicate ability">📑</button>\n'
+                       f'<button class="delete-btn" title="Remove ability">✕</button>\n'
+                       f'<div class="unit-name">{unit_name}</div>\n'
+                       f'<div class="ability-name">{ability_name}</div>\n'
+                       f'<div class="ability-desc">{description_bolded}</div>\n'
+                       f'</div>\n')
+            else:
+                text_id = texts.setdefault(description_bolded, len(texts))
+                yield (f'<div class="{class_attr}" id="{element_id}" draggable="true">'
+                       f'<button class="color-btn" title="Toggle color">🎨</button>'
+                       f'<button class="duplicate-btn" title="Duplicate ability">📑</button>'
+                       f'<button class="delete-btn" title="Remove ability">✕</button>'
+                       f'<div class="unit-name">{unit_name}</div>'
+                       f'<div class="ability-name">{ability_name}</div>'
+                       f'<div class="ability-desc" data-text="{text_id}"></div>'
+                       f'</div>')
+        yield '</div>\n'
+
+
+def generate_html_report(categorized_abilities, original_filename, url_core, url, compact=False, lazy=False):
+    # Report chunks are produced in order and joined once at the end
+    return "".join(iter_html_report(categorized_abilities, original_filename, url_core, url, compact, lazy))
+
+
+def iter_roster_forces(roster_file):
+    # Yields the forces of a New Recruit export one at a time, with ijson only the
+    # force being walked is held in memory instead of the whole roster. ijson reads
+    # plain UTF-8 only: a leading BOM is skipped, UTF-16/32 exports go through json.load
+    # which detects the encoding like the original upload handling did.
+    roster_file.seek(0)
+    encoding = json.detect_encoding(roster_file.read(4))
+    try: import ijson
+    except ImportError: ijson = None
+    if ijson is not None and encoding in ("utf-8", "utf-8-sig"):
+        start = 3 if encoding == "utf-8-sig" else 0
+        roster_file.seek(start)
+        found = False
+        for force in ijson.items(roster_file, "roster.forces.item", use_float=True):
+            found = True
+            yield force
+        if not found:
+            # No forces yielded: an empty forces array is a valid roster, a missing one is
+            # not an export at all and fails like json["roster"]["forces"] does
+            roster_file.seek(start)
+            if not any(prefix == "roster.forces" and event == "start_array"
+                       for prefix, event, _ in ijson.parse(roster_file)):
+                raise KeyError("forces")
+    else:
+        roster_file.seek(0)
+        yield from json.load(roster_file)["roster"]["forces"]
+
+
+def walk_roster(forces):
+    # Depth-first walk over all selections with an explicit stack, yields (kind, label, description)
+    # records where kind is "unit", "detachment" or "detachment_name" (label only)
+    for force in forces:
+        stack = [(iter(force["selections"]), "")]
+        while stack:
+            item = next(stack[-1][0], None)
+            if item is None:
+                stack.pop()
+                continue
+            current_unit = stack[-1][1]
+            name = item.get("name", "")
+            group = item.get("group", "")
+
+            # Check for detachment abilities
+            if (current_unit.lower() == "detachment" or 
+                name.lower() == "detachment" or 
+                group.lower() == "detachment"):
+                
+                # Get detachment name from this item or its selections
+                if name and name.lower() != "detachment":
+                    detachment_name_instance = name
+                else:
+                    for sub in item.get("selections", []):
+                        detachment_name_instance = sub.get("name", "")
+                        if detachment_name_instance:
+                            break
+                    else: detachment_name_instance = name
+                
+                if detachment_name_instance:
+                    yield "detachment_name", detachment_name_instance, None
+
+                # Check profiles for abilities
+                for profile in item.get("profiles", []):
+                    if profile.get("typeName") == "Abilities":
+                        ability_name = profile.get("name", "").strip()
+                        description = next(
+                            (char.get("$text", "").strip()
+                             for char in profile.get("characteristics", [])
+                             if char.get("name") == "Description"),
+                            ""
+                        )
+                        yield "detachment", "DETACHMENT ABILITY: " + ability_name, description
+                
+                # Check rules for abilities
+                for rule in item.get("rules", []):
+                    ability_name = rule.get("name", "").strip()
+                    description = rule.get("description", "").strip()
+                    if ability_name and description:
+                        yield "detachment", "DETACHMENT ABILITY: " + ability_name, description
+
+            # Normal unit abilities
+            elif "profiles" in item:
+                for profile in item["profiles"]:
+                    if profile.get("typeName") == "Abilities":
+                        ability_name = profile.get("name", "").strip()
+                        description = next(
+                            (char.get("$text", "").strip()
+                             for char in profile.get("characteristics", [])
+                             if char.get("name") == "Description"),
+                            ""
+                        )
+                        yield "unit", f"{current_unit or name}: {ability_name}", description
+
+            # Depth search
+            if "selections" in item:
+                stack.append((iter(item["selections"]), current_unit or name))
+
+
+class AbilityRecord(NamedTuple):
+    # One ability or stratagem, split into unit and ability name once when it is read.
+    # kind is "unit", "detachment", "stratagem" or "core", count how often the roster has it
+    unit: str
+    name: str
+    description: str
+    kind: str
+    count: int = 1
+
+    @property
+    def display_unit(self):
+        return f"{self.count}x {self.unit}" if self.count > 1 else self.unit
+
+
+def ability_record(label, description, kind, count=1):
+    # "Unit: Ability" label -> AbilityRecord, None without a unit part. The name ends at a second
+    # colon, as it always has in the report. Strings are interned since rosters repeat them a lot
+    parts = label.split(":")
+    if len(parts) < 2: return None
+    return AbilityRecord(sys.intern(parts[0].strip()), sys.intern(parts[1].strip()), sys.intern(description), kind, count)
+
+
+def stratagem_records(stratagems, kind="stratagem"):
+    # [label, description, ...] lists from parse_stratagem_blocks or the snapshot -> AbilityRecords
+    return tuple(filter(None, (ability_record(x[0], x[1], kind) for x in stratagems if x)))
+
+
+def collect_abilities(records):
+    # Identical (label, description) records are merged as they come in, abilities and
+    # detachment abilities are returned as tuples of AbilityRecords in first-seen order,
+    # so the result can be cached and shared without copying
+    abilities = {}
+    detachment_abilities = {}
+    detachment_name = []
+
+    for kind, label, description in records:
+        if kind == "detachment_name":
+            detachment_name.append(label)
+            continue
+        counts = abilities if kind == "unit" else detachment_abilities
+        counts[label, description] = counts.get((label, description), 0) + 1
+
+    def records(counts, kind):
+        return tuple(filter(None, (ability_record(label, description, kind, count) for (label, description), count in counts.items())))
+
+    return records(abilities, "unit"), records(detachment_abilities, "detachment"), tuple(detachment_name)
+
+
+def extract_abilities_from_json(json_data):
+    return collect_abilities(walk_roster(json_data["roster"]["forces"]))
+
+
+def extract_abilities_from_file(roster_file):
+    # parse_ms is the JSON parsing behind iter_roster_forces, the rest of the span the walk
+    with perf_span("roster.parse_walk") as span:
+        abilities = collect_abilities(walk_roster(perf_iter(iter_roster_forces(roster_file), span, "parse_ms")))
+        if span.enabled: span.set(bytes=roster_file.tell(), abilities=len(abilities[0]), detachment_abilities=len(abilities[1]))
+    return abilities
+
+
+_roster_cache = OrderedDict()
+_roster_cache_lock = threading.Lock()
+
+
+def extract_abilities_from_bytes(roster_bytes):
+    # Cached by a digest of the raw upload, a repeat submit skips JSON parsing entirely
+    # and gets the same immutable result back
+    key = hashlib.blake2b(roster_bytes, digest_size=16).digest()
+    with _roster_cache_lock:
+        if key in _roster_cache:
+            _roster_cache.move_to_end(key)
+            return _roster_cache[key]
+
+    abilities = extract_abilities_from_file(io.BytesIO(roster_bytes))
+    with _roster_cache_lock:
+        _roster_cache[key] = abilities
+        while len(_roster_cache) > ROSTER_CACHE_SIZE:
+            _roster_cache.popitem(last=False)
+    return abilities
+
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+def get_http_session():
+    # One keep-alive session per process, at most HTTP_MAX_CONNECTIONS_PER_HOST open sockets
+    # per host (further requests wait for a free one) and bounded retries with backoff
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+
+            retry = Retry(total=HTTP_RETRIES,
+                          backoff_factor=HTTP_BACKOFF,
+                          status_forcelist=(429, 500, 502, 503, 504),
+                          allowed_methods=frozenset(["GET", "HEAD"]),
+                          raise_on_status=False)
+            adapter = HTTPAdapter(pool_maxsize=HTTP_MAX_CONNECTIONS_PER_HOST, pool_block=True, max_retries=retry)
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers.update({"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"})
+            _http_session = session
+    return _http_session
+
+
+def http_get(url, headers=None):
+    return get_http_session().get(url, headers=headers, timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+
+
+class PageCache:
+    # Disk-backed page store keyed by URL. Fresh entries (younger than ttl) are served
+    # without touching the network, stale ones are revalidated with a conditional GET
+    # and the least recently used pages are evicted once max_bytes is exceeded.
+    def __init__(self, directory, ttl, max_bytes):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.stats = {"hit": 0, "revalidated": 0, "miss": 0}
+        self._lock = threading.Lock()
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, key + ".html"), os.path.join(self.directory, key + ".json")
+
+    def _write(self, path, text):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    def _load(self, url):
+        body_path, meta_path = self._paths(url)
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(body_path, encoding="utf-8") as f:
+                return meta, f.read()
+        except (OSError, ValueError):
+            return None, None
+
+    def _store(self, url, meta, text=None):
+        body_path, meta_path = self._paths(url)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            if text is not None:
+                self._write(body_path, text)
+            else:
+                os.utime(body_path)
+            self._write(meta_path, json.dumps(meta))
+            self._evict()
+        except OSError:
+            pass
+
+    def _evict(self):
+        entries, total = [], 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".html"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        # Oldest access first, body mtime doubles as the LRU timestamp
+        for _, size, body_path in sorted(entries):
+            if total <= self.max_bytes: break
+            for path in (body_path, body_path[:-5] + ".json"):
+                try: os.remove(path)
+                except OSError: pass
+            total -= size
+
+    def _count(self, status):
+        with self._lock:
+            self.stats[status] += 1
+        return status
+
+    def fetch(self, url):
+        # Returns (html, status) with status one of "hit", "revalidated" or "miss"
+        meta, text = self._load(url)
+        headers = {}
+        if meta:
+            if time.time() - meta["fetched"] < self.ttl:
+                try: os.utime(self._paths(url)[0])
+                except OSError: pass
+                return text, self._count("hit")
+            if meta.get("etag"): headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"): headers["If-Modified-Since"] = meta["last_modified"]
+
+        response = http_get(url, headers=headers)
+        if meta and response.status_code == 304:
+            meta["fetched"] = time.time()
+            self._store(url, meta)
+            return text, self._count("revalidated")
+
+        if response.status_code == 200:
+            meta = {"url": url,
+                    "fetched": time.time(),
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified")}
+            self._store(url, meta, response.text)
+        return response.text, self._count("miss")
+
+
+page_cache = PageCache(PAGE_CACHE_DIR, PAGE_CACHE_TTL, PAGE_CACHE_MAX_BYTES)
+
+
+def normalize_heading(tt):
+    return re.sub(r"[^a-zA-Z0-9]","", tt.lower()).replace(" ", "")
+
+
+def _soup_headings(html, parser='html.parser'):
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, parser)
+    for header_tag in soup.find_all(HEADING_TAGS):
+        texts = []
+        for sibling in header_tag.next_siblings:
+            if sibling.name is None: continue
+            if sibling.name in HEADING_TAGS: break  # Stop at next header
+            texts.append(sibling.get_text(strip=False))
+        yield header_tag.name, header_tag.get_text(), header_tag.string is not None, texts
+
+
+_lxml = None
+
+
+def load_lxml():
+    # (etree, lxml.html, parser) on first use, False when lxml is not installed
+    global _lxml
+    if _lxml is None:
+        try:
+            from lxml import etree, html as lxml_html
+            _lxml = etree, lxml_html, lxml_html.HTMLParser(remove_comments=True, remove_pis=True)
+        except ImportError:
+            _lxml = False
+    return _lxml
+
+
+def _lxml_single_string(element):
+    # lxml counterpart of BeautifulSoup's Tag.string being set: the element holds exactly one
+    # text node, either directly or through a chain of single children
+    children = list(element)
+    if not children:
+        return bool(element.text)
+    return not element.text and len(children) == 1 and not children[0].tail and _lxml_single_string(children[0])
+
+
+def _lxml_headings(html):
+    # Only the headings and their sibling runs are turned into text; script, style and
+    # template contents are dropped first since BeautifulSoup's get_text skips them too
+    etree, lxml_html, parser = load_lxml()
+    root = lxml_html.document_fromstring(html, parser=parser)
+    etree.strip_elements(root, "script", "style", "template", with_tail=False)
+    for header in root.iter(*HEADING_TAGS):
+        texts = []
+        for sibling in header.itersiblings():
+            if sibling.tag in HEADING_TAGS: break  # Stop at next header
+            texts.append(sibling.text_content())
+        yield header.tag, header.text_content(), _lxml_single_string(header), texts
+
+
+def _index_entries(headings):
+    # Sort keys follow the old two-pass search: headings whose text is a single string by
+    # level, then the h2-h4 headings with inline markup in document order. The first pass
+    # matched on Tag.string, so marked-up h1, h5 and h6 headings were never found at all.
+    entries = []
+    for position, (tag, title, single_string, texts) in enumerate(headings):
+        if single_string:
+            entries.append(((0, HEADING_TAGS.index(tag), position), normalize_heading(title), texts))
+        elif tag in ('h2', 'h3', 'h4'):
+            entries.append(((1, 0, position), normalize_heading(title), texts))
+    return entries
+
+
+def build_heading_index(html, parser=HTML_PARSER):
+    # Maps every normalized heading on the page to the texts of its sibling blocks
+    # (up to the next heading), ordered so the first substring match is the same
+    # header the old per-level search found. "lxml" walks the lxml tree directly and
+    # falls back to html.parser when lxml is missing or cannot parse the page.
+    found = None
+    if parser == "lxml":
+        lxml = load_lxml()
+        if lxml:
+            try: found = _index_entries(_lxml_headings(html))
+            except (ValueError, lxml[0].ParserError): pass
+        parser = "html.parser"
+    if found is None:
+        found = _index_entries(_soup_headings(html, parser))
+
+    headings = {}
+    for _, key, texts in sorted(found, key=lambda x: x[0]):
+        headings.setdefault(key, texts)
+    return {"headings": headings, "lookups": {}}
+
+
+_heading_index_cache = OrderedDict()
+_heading_index_lock = threading.Lock()
+
+
+def get_heading_index(html, parser=HTML_PARSER):
+    if parser == "lxml" and not load_lxml():
+        parser = "html.parser"
+    key = (hashlib.sha1(html.encode("utf-8")).hexdigest(), parser)
+    with _heading_index_lock:
+        if key in _heading_index_cache:
+            _heading_index_cache.move_to_end(key)
+            return _heading_index_cache[key]
+
+    with perf_span("html.parse", parser=parser, chars=len(html)):
+        index = build_heading_index(html, parser)
+    with _heading_index_lock:
+        _heading_index_cache[key] = index
+        while len(_heading_index_cache) > HEADING_INDEX_CACHE_SIZE:
+            _heading_index_cache.popitem(last=False)
+    return index
+
+
+def find_heading_blocks(index, name):
+    search_name = normalize_heading(name)
+    lookups = index["lookups"]
+    if search_name not in lookups:
+        lookups[search_name] = next((texts for key, texts in index["headings"].items() if search_name in key), None)
+    return lookups[search_name]
+
+
+def parse_stratagem_blocks(blocks):
+    stratagems = []
+    search_CP = ["1CP","2CP","3CP"]
+    ref = []
+    temp = []
+    skip = 0
+
+    for block in blocks:
+        text = block.replace("\n\n","\n")
+
+        for n, section in enumerate(text.split("\n")):
+            if n == 0 and section.lower().startswith("stratagems"): section = section[10:]
+
+            if section.strip() in search_CP:
+                skip = 2
+                try: del stratagems[-1][-1]
+                except: pass
+
+                ref, nr = temp[-1], -1
+                while ref.strip() == "":
+                    nr -= 1
+                    ref = temp[nr]
+                
+                ref = ["Stratagem: " + ref.strip() + " " + section.strip()]
+                stratagems.append(ref)
+
+            elif stratagems and not skip:
+                stratagems[-1].append(section.replace(".",".\n"))
+            else: skip -= 1
+
+            if section.strip() != "": temp.append(section.replace(".",".\n"))
+
+    return stratagems
+
+
+def extract_stratagems_from_waha(stratagems, detachment_name, url):
+    with perf_span("page.fetch", url=url) as span:
+        html, cache_status = page_cache.fetch(url)
+        span.set(status=cache_status, chars=len(html))
+
+    # Look for headers, falling back to html.parser when another configured parser finds no stratagems.
+    # The span includes html.parse when the heading index was not cached yet
+    with perf_span("stratagems.find", detachment=detachment_name) as span:
+        for parser in dict.fromkeys([HTML_PARSER, "html.parser"]):
+            found = parse_stratagem_blocks(find_heading_blocks(get_heading_index(html, parser), detachment_name) or [])
+            if found: break
+        span.set(parser=parser, found=len(found))
+
+    stratagems.extend(found)
+    return cache_status
+
+
+def snapshot_faction(url):
+    return url.rstrip("/").rsplit("/", 1)[-1].lower()
+
+
+_snapshot_connection = None
+_snapshot_lock = threading.Lock()
+
+
+def lookup_snapshot_stratagems(detachment_name, url):
+    # Returns the [name, description] stratagems stored for the detachment, or None when there
+    # is no snapshot or it does not know the faction/detachment. Opened on first use only.
+    global _snapshot_connection
+    with _snapshot_lock:
+        if _snapshot_connection is None:
+            if os.path.exists(SNAPSHOT_PATH):
+                import pathlib
+                import sqlite3
+                _snapshot_connection = sqlite3.connect(pathlib.Path(SNAPSHOT_PATH).resolve().as_uri() + "?mode=ro",
+                                                       uri=True, check_same_thread=False)
+            else:
+                _snapshot_connection = False
+        if not _snapshot_connection:
+            return None
+
+        faction = snapshot_faction(url)
+        heading = _snapshot_connection.execute(
+            "SELECT rank FROM headings WHERE faction = ? AND instr(name, ?) > 0 ORDER BY rank LIMIT 1",
+            (faction, normalize_heading(detachment_name))).fetchone()
+        if heading is None:
+            return None
+        rows = _snapshot_connection.execute(
+            "SELECT name, description FROM stratagems WHERE faction = ? AND rank = ? ORDER BY position",
+            (faction, heading[0])).fetchall()
+    return [list(row) for row in rows] or None
+
+
+def load_stratagems(detachment_name, url, kind="stratagem"):
+    with perf_span("snapshot.lookup", detachment=detachment_name) as span:
+        stratagems = lookup_snapshot_stratagems(detachment_name, url)
+        span.set(found=len(stratagems or []))
+    if stratagems:
+        return stratagem_records(stratagems, kind), "rules snapshot"
+
+    stratagems = []
+    cache_status = extract_stratagems_from_waha(stratagems, detachment_name, url)
+    return stratagem_records(stratagems, kind), f"page cache {cache_status}"
+
+
+def load_stratagem_sources(sources):
+    # Loads all {source: (detachment_name, url)} pages in parallel and yields
+    # (source, stratagems, origin) as each one finishes, stratagems is None on failure.
+    # Records from the "core" source are of kind "core", all others "stratagem"
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    with ThreadPoolExecutor(max_workers=len(sources)) as executor:
+        # Each worker runs in a copy of the caller's context so its spans land in the same trace
+        futures = {executor.submit(contextvars.copy_context().run, load_stratagems, name, url,
+                                   "core" if source == "core" else "stratagem"): source
+                   for source, (name, url) in sources.items()}
+        for future in as_completed(futures):
+            try: stratagems, origin = future.result()
+            except Exception: stratagems, origin = None, None
+            yield futures[future], stratagems, origin
+
+
+def core_rules_url(url):
+    return "/".join(url.split("/")[:4]) + "/the-rules/core-rules/"
+
+
+def load_roster_stratagems(detachment_name, url, include_core=False):
+    # Non-interactive version of the lookup in main(), returns (stratagems, core_stratagems, origins)
+    sources = {"detachment": (detachment_name, url)}
+    if include_core: sources["core"] = ("Stratagem", core_rules_url(url))
+
+    found, origins = {}, {}
+    for source, stratagems, origin in load_stratagem_sources(sources):
+        found[source], origins[source] = stratagems or (), origin
+
+    # Core Stratagems are only included alongside the detachment ones
+    stratagems = found["detachment"]
+    return stratagems, found.get("core", ()) if stratagems else (), origins
+
+
+def compile_keyword_matcher(keywords):
+    # One regex over a trie of all keywords. The lookahead at each position follows the
+    # longest keyword starting there and every shorter keyword on the same trie path is a
+    # prefix of it, so all occurrences (overlapping ones included) come out of one pass.
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def trie_pattern(node):
+        branches = [re.escape(char) + trie_pattern(child) for char, child in sorted(node.items()) if char]
+        if not branches: return ""
+        pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{pattern})?" if "" in node else pattern
+
+    regex = re.compile("(?=(" + trie_pattern(trie) + "))")
+    prefixes = {keyword: frozenset(k for k in keywords if keyword.startswith(k)) for keyword in keywords}
+
+    def match(text):
+        found = set()
+        for longest in set(regex.findall(text)):
+            found |= prefixes[longest]
+        return found
+
+    return match
+
+
+PHASE_KEYWORDS = {
+    "FIGHT PHASE":    [[" fight", " fights", " fight phase", " weapon skill", " melee attack", " melee attacks", " melee weapon", " melee weapons", " end of your opponents turn"], ["fire overwatch"]],
+    "CHARGE PHASE":   [[" charge phase", " charge roll", " charge move"], []],
+    "SHOOTING PHASE": [[" shoot", " shooting phase", " ranged attack", " ranged attacks", " ranged weapon", " ranged weapons", "stealth"], ["fire overwatch"]],
+    "MOVEMENT PHASE": [[" moves", " a move", "normal move", " fallback", " fall back", " advance ", " move phase", " movement phase", " deepstrike", " deep strike"], ["as if it were your movement phase"]],
+    "COMMAND PHASE":  [[" start of your turn", " start of any turn", " start of the battleround", " start of your opponents turn", " command phase", " order", " battle-shock step", " battleshock step"], ["fire overwatch"]],
+    "ANY PHASE":      [[" any phase", "any phase", "each time", " each time", "battle shock", "battle-shock", " attack", " attacks", " weapon", " weapons", " stratagem"], ["fire overwatch"]],
+    "DEPLOYMENT / RESERVES": [[" reserves", " declare battle formations", " scouts", " infiltrators"], ["fire overwatch"]]}
+
+_phase_table = [(phase, frozenset(keywords), frozenset(exclusions)) for phase, (keywords, exclusions) in PHASE_KEYWORDS.items()]
+_match_phase_keywords = compile_keyword_matcher({k for keywords, exclusions in PHASE_KEYWORDS.values() for k in keywords + exclusions})
+
+
+def classify_description(desc_lower):
+    # Phases in PHASE_KEYWORDS order, "ANY PHASE" (and everything after it) only when nothing else matched
+    hits = _match_phase_keywords(desc_lower)
+    matched_phases = []
+    for phase, keywords, exclusions in _phase_table:
+        if matched_phases and phase == "ANY PHASE": break
+        if hits & keywords and not hits & exclusions:
+            matched_phases.append(phase)
+    return matched_phases
+
+
+@functools.lru_cache(maxsize=CLASSIFICATION_CACHE_SIZE)
+def classify_ability_text(description):
+    # Process-wide memo keyed by the description text itself, repeated datasheets and
+    # shared rules (Leader, Deep Strike, ...) are normalized and classified only once
+    desc_lower = re.sub(r'\s+', ' ', description).strip().lower().replace("´","").replace("'","")
+    description = description.replace("^^", "")
+    description = re.sub(r"\b([A-Z]{2,})\b", r"**\1**", description)
+    return desc_lower, description, tuple(classify_description(desc_lower))
+
+
+def classify_records(records):
+    # The expensive half of categorize_abilities: (record with marked description, phases) for
+    # every AbilityRecord, independent of the exclusions so it can be kept around
+    classified = []
+    with perf_span("classify", records=len(records)) as span:
+        cache_before = classify_ability_text.cache_info() if span.enabled else None
+        for record in records:
+            desc_lower, description, matched_phases = classify_ability_text(record.description)
+            classified.append((record._replace(description=description), matched_phases))
+
+        if span.enabled:
+            cache_after = classify_ability_text.cache_info()
+            span.set(cache_hits=cache_after.hits - cache_before.hits, cache_misses=cache_after.misses - cache_before.misses)
+    return tuple(classified)
+
+
+def group_by_phase(classified, exclude_abilities):
+    # Cheap second half: drops excluded abilities from classify_records output and sorts the phases
+    phases = {
+        "DEPLOYMENT / RESERVES": [],
+        "ANY PHASE": [],
+        "COMMAND PHASE": [],
+        "MOVEMENT PHASE": [],
+        "SHOOTING PHASE": [],
+        "CHARGE PHASE": [],
+        "FIGHT PHASE": [],
+        "OTHER": []
+    }
+
+    priority_order = ["start of", "declare battle formations", "infiltrators", "scouts", "after this", "until the end of", "until the start of", "end of"]
+    priority_center = len(priority_order) // 2
+
+    def priority_sort_key(s):
+        s = s.description.lower()
+        for i, p in enumerate(priority_order):
+            if p in s: return i
+        return priority_center
+
+    exclude_abilities = {x.lower() for x in exclude_abilities}
+
+    with perf_span("categorize.group"):
+        for record, matched_phases in classified:
+            if exclude_abilities and record.name.lower() in exclude_abilities: continue
+
+            for phase in matched_phases:
+                phases[phase].append(record)
+
+            if not matched_phases: phases["OTHER"].append(record)
+
+        for phase in phases:
+            phases[phase].sort(key=lambda x : x.name)
+            phases[phase].sort(key=priority_sort_key)
+
+    return phases
+
+
+def categorize_abilities(detachment_abilities, core_stratagems, stratagems, abilities, exclude_abilities):
+    return group_by_phase(classify_records([*detachment_abilities, *core_stratagems, *stratagems, *abilities]), exclude_abilities)